@@ -4,108 +4,208 @@ import time
 import math
 import sys
 import os
+import struct
+from array import array
+
+START_TIME = time.perf_counter()
+first_frame_time = None
 
 school_directions = {}
 cluster_centers = {}
 cluster_bounds = {}
 
+# specie ancora da far nascere dopo il primo frame (avvio veloce)
+pending_species = []
+
+# mappa di occupazione della scena statica, una bytearray per riga:
+# EMPTY dove c'e' acqua, altrimenti il segno (layer_mark) del layer piu'
+# vicino che copre la cella. Gli oggetti fino a "mid" sono ostacoli da
+# evitare (scene_obstacles); scene_cover dice, per ogni layer di sprite,
+# quali celle sono coperte da scenografia che sta davanti
+EMPTY = 0
+scene_occupancy = []
+scene_cover = {}
+scene_obstacles = []
+
 CONFIG_FILE = "config.json"
+SCENE_CACHE_FILE = "scene_cache.json"
+
+# --fast: primo frame subito, il resto dopo
+FAST_START = {"intro": "background", "scene_cache": True, "defer_spawn": True}
+fast_start = False
 
 def load_config():
     with open(CONFIG_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def load_acq():
-    config = load_config()
-    enable_raw_mode()
+def startup_options(config):
+    opts = {"intro": "full", "scene_cache": False, "defer_spawn": False}
+    opts.update(config.get("startup", {}))
+    if fast_start:
+        opts.update(FAST_START)
+    return opts
 
+def load_scene_cache(key):
+    # posizioni degli oggetti statici gia' calcolate per questa config e dimensione
     try:
-        size = os.get_terminal_size()
-        visible_x = size.columns
-        visible_y = size.lines
-    except:
-        visible_x = 120
-        visible_y = 40
+        with open(SCENE_CACHE_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cache.get("key") != key:
+        return None
+    return cache.get("placements")
+
+def save_scene_cache(key, placements):
+    try:
+        with open(SCENE_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "placements": placements}, f)
+    except OSError:
+        pass
+
+def spawn_species(cfg, fish_list, world_y, world_x, visible_y):
+    initial_n = min(10, cfg.get("max_population", 10))
+    for _ in range(initial_n):
+        fish = Fish(world_y, world_x, cfg, visible_y)
+        fish.school_id = assign_school(fish, fish_list)
+        if fish.school_id not in school_directions:
+            school_directions[fish.school_id] = random.choice([-1, 1])
+
+        fish_list.append(fish)
+
+def load_acq(config=None, size=None, backend=None, interactive=True,
+             scene_cache=False, defer_spawn=False):
+    global output_backend, scene_occupancy, scene_cover, scene_obstacles, current_field
+    if config is None:
+        config = load_config()
+    output_backend = backend or make_backend(backend_override or config.get("backend", "auto"))
+    sprite_cache.clear()
+    if interactive:
+        enable_raw_mode()
+
+    if size:
+        visible_y, visible_x = size
+    else:
+        try:
+            size = os.get_terminal_size()
+            visible_x = size.columns
+            visible_y = size.lines
+        except:
+            visible_x = 120
+            visible_y = 40
 
     world_y = visible_y
     world_x = visible_x
 
+    current_field = CurrentField(visible_y, visible_x, config.get("current"))
+
     renderer = Renderer(visible_y, visible_x)
+    compositor = Compositor(visible_y, visible_x)
 
-        
-    static_layer = [[(" ", "", "") for _ in range(visible_x)] for _ in range(visible_y)]
+    gradient = config.get("background", {}).get("gradient")
+    if gradient:
+        compositor.set_gradient(gradient[0], gradient[-1])
+
+    # una griglia per ogni layer di scenografia, None = trasparente
+    scenery = {}
+    scene_occupancy = [bytearray(visible_x) for _ in range(visible_y)]
     static_objects = []
     occupied = []
 
     
+    scene_key = json.dumps([config["static_objects"], visible_y, visible_x], sort_keys=True)
+    cached = load_scene_cache(scene_key) if scene_cache else None
+    if cached is not None and len(cached) != sum(o.get("count", 1) for o in config["static_objects"]):
+        cached = None
+    placements = []
+
     for obj in config["static_objects"]:
         shape = obj["shape"]
         h = len(shape)
-        w = max(len(line) for line in shape)
+        w = max(line_width(line) for line in shape)
         count = obj.get("count", 1)
         gap=0
 
         for _ in range(count):
-            y = visible_y - obj["y_offset_from_bottom"] - h
-            if y < 0:
-                y=0
-
-            if obj.get("random_x", False):
-                x = find_free_x_position(
-                    w,
-                    visible_x,
-                    occupied,
-                    cluster=obj.get("cluster"),
-                    cluster_radius_pct=obj.get("cluster_radius_pct", 0.15),
-                    cluster_hard=obj.get("cluster_hard", False),
-                    gap=int(obj.get("cluster_gap", 0))
-                )
-
+            if cached is not None:
+                x, y = cached[len(placements)]
             else:
-                x = obj.get("x", 0)
-                if x + w > visible_x:
-                    x = max(0, visible_x - w)
+                y = visible_y - obj["y_offset_from_bottom"] - h
+                if y < 0:
+                    y=0
+
+                if obj.get("random_x", False):
+                    x = find_free_x_position(
+                        w,
+                        visible_x,
+                        occupied,
+                        cluster=obj.get("cluster"),
+                        cluster_radius_pct=obj.get("cluster_radius_pct", 0.15),
+                        cluster_hard=obj.get("cluster_hard", False),
+                        gap=int(obj.get("cluster_gap", 0))
+                    )
+
+                else:
+                    x = obj.get("x", 0)
+                    if x + w > visible_x:
+                        x = max(0, visible_x - w)
+
+                occupied.append((x, x + w + gap))
+                occupied.sort()
 
-            occupied.append((x, x + w + gap))
-            occupied.sort()
+                if obj.get("specie") == "starfish":
+                    if obj["name"] == "starfishA":
+                        y = visible_y // 2 + int(random.uniform( visible_y / 8, visible_y / 4))
+                    elif obj["name"] == "starfishB":
+                        y = visible_y // 2 - int(random.uniform( visible_y / 3, visible_y / 2))
 
-            if obj.get("specie") == "starfish":
-                if obj["name"] == "starfishA":
-                    y = visible_y // 2 + int(random.uniform( visible_y / 8, visible_y / 4))
-                elif obj["name"] == "starfishB":
-                    y = visible_y // 2 - int(random.uniform( visible_y / 3, visible_y / 2))
+            placements.append([x, y])
 
+            layer = check_layer(obj.get("layer", "near" if obj.get("foreground") else "far"))
             so = StaticObject(
                 y, x, shape,
                 rgb_fg=obj.get("rgb_fg"),
-                rgb_bg=obj.get("rgb_bg")
+                rgb_bg=obj.get("rgb_bg"),
+                layer=layer
             )
             static_objects.append(so)
-            so.draw_on_layer(static_layer)
+            if layer not in scenery:
+                scenery[layer] = [[None] * visible_x for _ in range(visible_y)]
+            so.draw_on_layer(scenery[layer], scene_occupancy)
+
+    scene_cover = cover_maps(scene_occupancy)
+    scene_obstacles = obstacle_map(scene_occupancy)
 
         
     rgb_sand = config.get("rgb_sand", [194, 178, 128])
     sand_chars = [",", ".", ":", "_", "-", "`", "~"]
 
+    if "far" not in scenery:
+        scenery["far"] = [[None] * visible_x for _ in range(visible_y)]
+    far = scenery["far"]
     for y in range(max(0, visible_y - 2), visible_y):
         for x in range(visible_x):
                 
-            if static_layer[y][x] == ("", "", "") or static_layer[y][x][0] == " ":
+            if all(grid[y][x] is None for grid in scenery.values()):
                 ch = random.choice(sand_chars)
                 fg_code = fg(*rgb_sand)
-                static_layer[y][x] = (ch, fg_code, "")
+                far[y][x] = (ch, fg_code, "")
+
+    for layer, grid in scenery.items():
+        compositor.set_static(layer, grid)
+
+    if scene_cache and cached is None:
+        save_scene_cache(scene_key, placements)
 
 
     fish_list = []
+    pending_species.clear()
     for cfg in config["species"]:
-        initial_n = min(10, cfg.get("max_population", 10))
-        for _ in range(initial_n):
-            fish = Fish(world_y, world_x, cfg, visible_y)
-            fish.school_id = assign_school(fish, fish_list)
-            if fish.school_id not in school_directions:
-                school_directions[fish.school_id] = random.choice([-1, 1])
-
-            fish_list.append(fish)
+        check_layer(cfg.get("layer", "mid"))
+        if defer_spawn:
+            pending_species.append(cfg)
+        else:
+            spawn_species(cfg, fish_list, world_y, world_x, visible_y)
 
                 
 
@@ -123,116 +223,597 @@ def load_acq():
         for _ in range(b_cfg["count"])
     ]
 
-    sys.stdout.write(CLEAR + move(1, 1) + HIDE_CURSOR)
-    sys.stdout.flush()
-    return config,renderer, static_layer, fish_list, bubbles,visible_y,visible_x,world_y,world_x
+    if interactive:
+        sys.stdout.write(CLEAR + move(1, 1) + HIDE_CURSOR)
+        sys.stdout.flush()
+    return config,renderer, compositor, fish_list, bubbles,visible_y,visible_x,world_y,world_x
 
 def move(y, x):
     return f"\033[{y};{x}H"
 
 def fg(r, g, b):
-    return f"\033[38;2;{r};{g};{b}m"
+    return output_backend.fg(r, g, b)
 
 def bg(r, g, b):
-    return f"\033[48;2;{r};{g};{b}m"
+    return output_backend.bg(r, g, b)
 
 RESET = "\033[0m"
+RESET_BYTES = RESET.encode()
 HIDE_CURSOR = "\033[?25l"
 SHOW_CURSOR = "\033[?25h"
 CLEAR = "\033[2J"
 
 WINDOWS = os.name == "nt"
 
-if WINDOWS:
-    import msvcrt
-else:
-    import termios
-    import tty
-    import select
+# i moduli di piattaforma (msvcrt / termios, tty, select) si importano
+# dentro le funzioni, solo quando servono: l'avvio resta piu' leggero
 
 def key_pressed():
     if WINDOWS:
+        import msvcrt
         return msvcrt.kbhit()
+    elif not sys.stdin.isatty():
+        # es. server senza terminale
+        return False
     else:
+        import select
         dr, _, _ = select.select([sys.stdin], [], [], 0)
         return dr != []
 
 def get_key():
     if WINDOWS:
+        import msvcrt
         return msvcrt.getch().decode(errors="ignore")
     else:
         return sys.stdin.read(1)
 
+old_settings = None
+
 def enable_raw_mode():
-    if not WINDOWS:
+    if not WINDOWS and sys.stdin.isatty():
+        import termios
+        import tty
         global old_settings
         old_settings = termios.tcgetattr(sys.stdin)
         tty.setcbreak(sys.stdin)
 
 def disable_raw_mode():
-    if not WINDOWS:
+    if not WINDOWS and old_settings is not None:
+        import termios
         termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
 
 
+# ---------- SCRITTURA BINARIA ----------
+class FdWriter:
+    # scrive byte direttamente sul file descriptor di stdout, senza
+    # passare dal text layer (encoding + line buffering) di sys.stdout
+    CHUNK = 1 << 16
+    # una write piu' lenta di cosi' vuol dire che il terminale non sta dietro
+    SLOW_WRITE = 0.02
+
+    def __init__(self, stream=None):
+        stream = stream or sys.stdout
+        stream.flush()
+        if WINDOWS:
+            # la console di Windows vuole UTF-8 tramite il raw io di python,
+            # os.write userebbe la code page della console
+            self._write = stream.buffer.raw.write
+            self.fd = None
+        else:
+            self.fd = stream.fileno()
+            self._write = self._os_write
+        self.blocked_time = 0.0
+
+    def _os_write(self, data):
+        return os.write(self.fd, data)
+
+    def write(self, data):
+        t0 = time.perf_counter()
+        view = memoryview(data)
+        total = len(view)
+        off = 0
+        while off < total:
+            try:
+                n = self._write(view[off:off + self.CHUNK])
+            except BlockingIOError:
+                n = None
+            if n is None:
+                # terminale non bloccante pieno (EAGAIN): aspetta che si liberi
+                self._wait_writable()
+                continue
+            off += n
+
+        # su un fd bloccante (il caso normale) os.write resta fermo invece di
+        # dare EAGAIN: conta come bloccata ogni write lenta
+        elapsed = time.perf_counter() - t0
+        if elapsed > self.SLOW_WRITE:
+            self.blocked_time += elapsed
+
+    def _wait_writable(self):
+        if self.fd is not None:
+            import select
+            select.select([], [self.fd], [], 0.1)
+        else:
+            time.sleep(0.001)
+
+
+# ---------- OUTPUT BACKENDS ----------
+# livelli del cubo 6x6x6 della palette xterm (indici 16..231)
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+CUBE_INDEX = bytes(
+    min(range(6), key=lambda i: abs(CUBE_LEVELS[i] - v)) for v in range(256)
+)
+# rampa di grigi 232..255: 8, 18, ..., 238
+GRAY_INDEX = bytes(
+    max(0, min(23, (v - 3) // 10)) for v in range(256)
+)
+
+def rgb_to_256(r, g, b):
+    ri, gi, bi = CUBE_INDEX[r], CUBE_INDEX[g], CUBE_INDEX[b]
+    cr, cg, cb = CUBE_LEVELS[ri], CUBE_LEVELS[gi], CUBE_LEVELS[bi]
+    cube_dist = (r - cr) ** 2 + (g - cg) ** 2 + (b - cb) ** 2
+
+    gi_ = GRAY_INDEX[(r + g + b) // 3]
+    gv = 8 + 10 * gi_
+    gray_dist = (r - gv) ** 2 + (g - gv) ** 2 + (b - gv) ** 2
+
+    if gray_dist < cube_dist:
+        return 232 + gi_
+    return 16 + 36 * ri + 6 * gi + bi
+
+
+class TrueColorBackend:
+    name = "truecolor"
+
+    def __init__(self):
+        self.fg_cache = {}
+        self.bg_cache = {}
+        self.writer = None
+
+    def fg(self, r, g, b):
+        key = (r, g, b)
+        code = self.fg_cache.get(key)
+        if code is None:
+            code = self.fg_cache[key] = self.color_code(38, r, g, b)
+        return code
+
+    def bg(self, r, g, b):
+        key = (r, g, b)
+        code = self.bg_cache.get(key)
+        if code is None:
+            code = self.bg_cache[key] = self.color_code(48, r, g, b)
+        return code
+
+    def color_code(self, base, r, g, b):
+        return f"\033[{base};2;{r};{g};{b}m"
+
+    def write(self, data):
+        if self.writer is None:
+            self.writer = FdWriter()
+        self.writer.write(data)
+
+
+class Palette256Backend(TrueColorBackend):
+    name = "256"
+
+    def color_code(self, base, r, g, b):
+        return f"\033[{base};5;{rgb_to_256(r, g, b)}m"
+
+
+class MonoBackend(TrueColorBackend):
+    name = "mono"
+
+    def color_code(self, base, r, g, b):
+        return ""
+
+
+class NullBackend(TrueColorBackend):
+    # scarta l'output ma conta i byte: serve per i benchmark
+    name = "null"
+
+    def __init__(self):
+        super().__init__()
+        self.frames = 0
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.frames += 1
+        self.bytes_written += len(data)
+
+
+BACKENDS = {
+    "truecolor": TrueColorBackend,
+    "256": Palette256Backend,
+    "mono": MonoBackend,
+    "null": NullBackend,
+}
+
+def detect_backend():
+    colorterm = os.environ.get("COLORTERM", "").lower()
+    term = os.environ.get("TERM", "").lower()
+
+    if colorterm in ("truecolor", "24bit") or os.environ.get("WT_SESSION"):
+        return "truecolor"
+    if "256" in term:
+        return "256"
+    if term == "dumb":
+        return "mono"
+    return "truecolor"
+
+def make_backend(name="auto"):
+    if name in (None, "", "auto"):
+        name = detect_backend()
+    if name not in BACKENDS:
+        raise ValueError(f"backend sconosciuto: {name!r} (usa: auto, {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+output_backend = TrueColorBackend()
+backend_override = None
+
+
+# ---------- LARGHEZZA DEI CARATTERI ----------
+# una cella = una colonna del terminale. Un carattere largo (emoji, CJK)
+# occupa la sua cella e quella a destra, che contiene WIDE_TAIL; i segni
+# combinanti restano nella stessa cella del carattere base ("e\u0301").
+# Le larghezze si calcolano una volta per carattere, quando si caricano
+# gli sprite, e restano in char_widths.
+WIDE_TAIL = ""
+char_widths = {}
+
+def char_width(ch):
+    w = char_widths.get(ch)
+    if w is None:
+        import unicodedata
+        if unicodedata.combining(ch) or unicodedata.category(ch) in ("Mn", "Me", "Cf"):
+            w = 0
+        elif unicodedata.east_asian_width(ch) in ("W", "F"):
+            w = 2
+        else:
+            w = 1
+        char_widths[ch] = w
+    return w
+
+def cell_width(text):
+    # colonne occupate da una cella: 0 per WIDE_TAIL
+    w = char_widths.get(text)
+    if w is None:
+        w = char_widths[text] = sum(char_width(ch) for ch in text)
+    return w
+
+def split_cells(line):
+    # riga di testo -> una stringa per colonna
+    cells = []
+    for ch in line:
+        w = char_width(ch)
+        if w == 0:
+            if not cells:
+                cells.append(" ")
+            i = -2 if cells[-1] == WIDE_TAIL else -1
+            cells[i] += ch
+        else:
+            cells.append(ch)
+            if w == 2:
+                cells.append(WIDE_TAIL)
+    return cells
+
+def line_width(line):
+    return len(split_cells(line))
+
+def is_wide(cell):
+    return cell is not None and cell_width(cell[0]) == 2
+
+def normalize_wide_row(row):
+    # teste senza coda e code senza testa (sovrapposizioni, bordi) diventano
+    # spazi; la coda prende lo stile della testa, come sul terminale
+    w = len(row)
+    for x in range(w):
+        cell = row[x]
+        if cell is None:
+            row[x] = (" ", "", "")
+        elif cell[0] == WIDE_TAIL:
+            head = row[x - 1] if x else None
+            if not is_wide(head):
+                row[x] = (" ", cell[1], cell[2])
+            elif cell[1:] != head[1:]:
+                row[x] = (WIDE_TAIL,) + head[1:]
+        elif is_wide(cell):
+            nxt = row[x + 1] if x + 1 < w else None
+            if nxt is None or nxt[0] != WIDE_TAIL:
+                row[x] = (" ", cell[1], cell[2])
+
+
 class Renderer:
-    def __init__(self, height, width):
+    def __init__(self, height, width, backend=None):
         self.h = height
         self.w = width
-        
+        self.backend = backend or output_backend
+
         self.front = [[None for _ in range(self.w)] for _ in range(self.h)]
         self.back  = [[None for _ in range(self.w)] for _ in range(self.h)]
 
-    def clear_back(self):
-        for y in range(self.h):
-            for x in range(self.w):
-                self.back[y][x] = None
+        # buffer di output riusato a ogni frame + sequenze gia' codificate
+        self.buf = bytearray(max(4096, self.h * self.w * 8))
+        self.row_codes = [b"\033[%d;" % (y + 1) for y in range(self.h)]
+        self.col_codes = [b"%dH" % (x + 1) for x in range(self.w)]
+        self.style_codes = {}
+        # carattere -> (byte, larghezza); wide_glyphs: quelli con larghezza != 1
+        self.glyph_codes = {}
+        self.wide_glyphs = set()
+
+        # ricevono ogni frame dopo il flush: listener.frame_flushed(renderer, data)
+        self.listeners = []
+
+        # sfondo di ogni riga per le celle senza bg (gradiente del compositor)
+        self.row_bg = [""] * self.h
 
     def set_cell(self, y, x, ch, fg_code="", bg_code=""):
         if 0 <= y < self.h and 0 <= x < self.w:
             self.back[y][x] = (ch, fg_code, bg_code)
 
-    def blit_static_layer(self, static_layer):
-        
+    def flush(self, force=False):
+        buf = self.buf
+        limit = len(buf) - 128
+        n = 0
+        row_codes = self.row_codes
+        col_codes = self.col_codes
+        style_codes = self.style_codes
+        glyph_codes = self.glyph_codes
+        wide_glyphs = self.wide_glyphs
+
+        # posizione del cursore e stile correnti del terminale:
+        # move e colori si emettono solo quando cambiano
+        cur_y = cur_x = -1
+        cur_fg = cur_bg = None
         for y in range(self.h):
-            row_s = static_layer[y]
-            row_b = self.back[y]
-            for x in range(self.w):
-                row_b[x] = row_s[x]
+            row_back = self.back[y]
+            row_front = self.front[y]
+            row_bg = self.row_bg[y]
+            start = 0
+            fixed = False
+            while start is not None:
+                xs = range(start, self.w)
+                start = None
+                for x in xs:
+                    new_cell = row_back[x]
+                    if new_cell is None:
+
+                        new_cell = (" ", "", "")
+                        row_back[x] = new_cell
+
+                    old_cell = row_front[x]
+                    if not force and new_cell == old_cell:
+                        continue
 
-    def flush(self, force=False):
-        out = []
+                    ch, fg_code, bg_code = new_cell
+                    glyph = glyph_codes.get(ch)
+                    if glyph is None:
+                        glyph = glyph_codes[ch] = (ch.encode(), cell_width(ch))
+                        if glyph[1] != 1:
+                            wide_glyphs.add(ch)
+                    piece, width = glyph
+
+                    if width != 1 or (wide_glyphs and old_cell is not None and old_cell[0] in wide_glyphs):
+                        if not fixed:
+                            # caratteri larghi nella riga: si sistema la riga
+                            # e si riparte dalla prima cella da riscrivere
+                            fixed = True
+                            start = self.fix_wide_row(y, force)
+                            break
+                        if ch == WIDE_TAIL:
+                            # la scrive gia' la testa a sinistra
+                            row_front[x] = new_cell
+                            continue
+
+                    row_front[x] = new_cell
+                    if not bg_code:
+                        bg_code = row_bg
+
+                    if n > limit:
+                        buf.extend(bytes(len(buf)))
+                        limit = len(buf) - 128
+
+                    if y != cur_y or x != cur_x:
+                        code = row_codes[y]
+                        buf[n:n + len(code)] = code
+                        n += len(code)
+                        code = col_codes[x]
+                        buf[n:n + len(code)] = code
+                        n += len(code)
+
+                    if fg_code is not cur_fg or bg_code is not cur_bg:
+                        code = style_codes.get((fg_code, bg_code))
+                        if code is None:
+                            code = (RESET + fg_code + bg_code).encode()
+                            style_codes[(fg_code, bg_code)] = code
+                        buf[n:n + len(code)] = code
+                        n += len(code)
+                        cur_fg = fg_code
+                        cur_bg = bg_code
+
+                    buf[n:n + len(piece)] = piece
+                    n += len(piece)
+
+                    cur_y = y
+                    cur_x = x + width
+
+        if n:
+            buf[n:n + len(RESET_BYTES)] = RESET_BYTES
+            n += len(RESET_BYTES)
+        with memoryview(buf) as view:
+            if n:
+                self.backend.write(view[:n])
+            for listener in self.listeners:
+                listener.frame_flushed(self, view[:n])
+
+    def fix_wide_row(self, y, force=False):
+        # riga con caratteri larghi: dopo normalize_wide_row ogni meta' rotta
+        # risulta cambiata e si riscrive, e una coda cambia solo insieme alla
+        # sua testa. Restituisce la prima x da riscrivere.
+        row_back = self.back[y]
+        row_front = self.front[y]
+        normalize_wide_row(row_back)
+        for x in range(self.w):
+            if force or row_back[x] != row_front[x]:
+                return x
+        return self.w
+
+    def keyframe(self):
+        # immagine completa del front buffer, per chi si collega a meta' stream
+        out = [RESET, CLEAR]
         for y in range(self.h):
-            for x in range(self.w):
-                new_cell = self.back[y][x]
-                if new_cell is None:
-                    
-                    new_cell = (" ", "", "")
-                    self.back[y][x] = new_cell
+            out.append(move(y + 1, 1))
+            cur_style = None
+            for cell in self.front[y]:
+                ch, fg_code, bg_code = cell or (" ", "", "")
+                bg_code = bg_code or self.row_bg[y]
+                if (fg_code, bg_code) != cur_style:
+                    out.append(RESET + fg_code + bg_code)
+                    cur_style = (fg_code, bg_code)
+                out.append(ch)
+        out.append(RESET)
+        return "".join(out).encode()
+
+# ---------- COMPOSITOR ----------
+# layer dal piu' lontano al piu' vicino. Ogni layer ha una parte statica
+# (scenografia, hud) salvata come span gia' pronti e una lista di sprite
+# disegnati a ogni frame (pesci, bolle).
+LAYER_ORDER = ("background", "far", "mid", "near", "bubbles", "hud")
+
+def check_layer(name):
+    if name not in LAYER_ORDER:
+        raise ValueError(f"layer sconosciuto: {name!r} (usa: {', '.join(LAYER_ORDER)})")
+    return name
+
+def layer_mark(layer):
+    return LAYER_ORDER.index(layer) + 1
+
+# segni di scene_occupancy che valgono come ostacolo (scenografia fino a "mid")
+OBSTACLE_MARK = layer_mark("mid")
+
+def cover_maps(occupancy):
+    # per ogni layer: 1 dove la scenografia e' in un layer piu' vicino
+    covers = {}
+    for layer in LAYER_ORDER:
+        mark = layer_mark(layer)
+        table = bytes(1 if v > mark else 0 for v in range(256))
+        covers[layer] = [row.translate(table) for row in occupancy]
+    return covers
+
+def obstacle_map(occupancy):
+    # 1 dove c'e' scenografia da evitare
+    table = bytes(1 if EMPTY < v <= OBSTACLE_MARK else 0 for v in range(256))
+    return [row.translate(table) for row in occupancy]
+
+def grid_spans(grid):
+    # run orizzontali di celle non trasparenti: (y, x0, x1, celle)
+    spans = []
+    for y, row in enumerate(grid):
+        x = 0
+        w = len(row)
+        while x < w:
+            if row[x] is None:
+                x += 1
+                continue
+            start = x
+            while x < w and row[x] is not None:
+                x += 1
+            spans.append((y, start, x, tuple(row[start:x])))
+    return tuple(spans)
+
+
+class Compositor:
+    def __init__(self, height, width):
+        self.h = height
+        self.w = width
+        self.row_bg = [""] * height
+        self.static = {}
+        self.spans = {name: () for name in LAYER_ORDER}
+        self.dirty = set()
+        self.hud_text = ""
+
+        # composito in cache dei layer solo statici sotto il primo layer con sprite
+        self.base = None
+        self.base_layers = None
+
+    def set_gradient(self, rgb_top, rgb_bottom):
+        rows = max(1, self.h - 1)
+        self.row_bg = [
+            bg(*(int(a + (b - a) * y / rows) for a, b in zip(rgb_top, rgb_bottom)))
+            for y in range(self.h)
+        ]
 
-                old_cell = self.front[y][x]
+    def set_static(self, layer, grid):
+        self.static[layer] = grid
+        self.dirty.add(layer)
 
-                if force or new_cell != old_cell:
-                    self.front[y][x] = new_cell
-                    ch, fg_code, bg_code = new_cell
-                    out.append(
-                        move(y + 1, x + 1) + RESET + fg_code + bg_code + ch + RESET
-                    )
+    def set_hud(self, text, rgb_fg=(255, 255, 255)):
+        if text == self.hud_text:
+            return
+        self.hud_text = text
+        # l'hud e' una sola riga: gli span si costruiscono direttamente
+        spans = ()
+        if text and self.h:
+            fg_code = fg(*rgb_fg)
+            text = split_cells(text)
+            x0 = max(0, self.w - len(text) - 1)
+            cells = tuple((ch, fg_code, "") for ch in text)
+            a, b = trim_wide(cells, 0, self.w - x0)
+            cells = cells[a:b]
+            spans = ((0, x0, x0 + len(cells), cells),)
+        self.static.pop("hud", None)
+        self.dirty.discard("hud")
+        self.spans["hud"] = spans
+        if self.base_layers and "hud" in self.base_layers:
+            self.base = None
+
+    def layer_spans(self, layer):
+        if layer in self.dirty:
+            self.dirty.discard(layer)
+            grid = self.static.get(layer)
+            self.spans[layer] = grid_spans(grid) if grid else ()
+        return self.spans[layer]
+
+    def compose(self, renderer, sprites=None):
+        sprites = sprites or {}
+        renderer.row_bg = self.row_bg
+
+        first = 0
+        while first < len(LAYER_ORDER) and not sprites.get(LAYER_ORDER[first]):
+            first += 1
+        below = LAYER_ORDER[:first]
+
+        if self.base is None or self.base_layers != below or self.dirty.intersection(below):
+            base = [[(" ", "", "")] * self.w for _ in range(self.h)]
+            for layer in below:
+                for y, x0, x1, cells in self.layer_spans(layer):
+                    base[y][x0:x1] = cells
+            self.base = base
+            self.base_layers = below
+
+        back = renderer.back
+        for y, row in enumerate(self.base):
+            back[y][:] = row
+
+        for layer in LAYER_ORDER[first:]:
+            for y, x0, x1, cells in self.layer_spans(layer):
+                back[y][x0:x1] = cells
+            for sprite in sprites.get(layer, ()):
+                sprite.draw(renderer)
 
-        if out:
-            sys.stdout.write("".join(out))
-            sys.stdout.flush()
 
 class StaticObject:
-    def __init__(self, y, x, shape, rgb_fg=None, rgb_bg=None):
+    def __init__(self, y, x, shape, rgb_fg=None, rgb_bg=None, layer="far"):
         self.y = y
         self.x = x
         self.shape = shape
         self.rgb_fg = rgb_fg
         self.rgb_bg = rgb_bg    
+        self.layer = layer
 
-    def draw_on_layer(self, layer):
+    def draw_on_layer(self, layer, occupancy=None):
+        mark = layer_mark(self.layer)
         for dy, line in enumerate(self.shape):
-            for dx, ch in enumerate(line):
+            for dx, ch in enumerate(split_cells(line)):
                 if ch != " ":
                     yy = self.y + dy
                     xx = self.x + dx
@@ -240,6 +821,82 @@ class StaticObject:
                         fg_code = fg(*self.rgb_fg) if self.rgb_fg else ""
                         bg_code = bg(*self.rgb_bg) if self.rgb_bg else ""
                         layer[yy][xx] = (ch, fg_code, bg_code)
+                        if occupancy is not None and occupancy[yy][xx] < mark:
+                            occupancy[yy][xx] = mark
+
+
+# ---------- CORRENTE ----------
+class CurrentField:
+    # campo di corrente grossolano (una cella ogni cell_w x cell_h caratteri)
+    # che evolve nel tempo. Pesci, meduse e bolle lo campionano con una
+    # interpolazione bilineare: i seni si calcolano per cella, non per pesce,
+    # e a ogni tick si aggiornano solo alcune righe del campo.
+    def __init__(self, height, width, cfg=None):
+        cfg = cfg or {}
+        self.cell_w = cfg.get("cell_w", 8)
+        self.cell_h = cfg.get("cell_h", 4)
+        self.rows_per_tick = cfg.get("rows_per_tick", 3)
+        self.wave_speed = cfg.get("wave_speed", 0.8)
+        self.drift_speed = cfg.get("drift_speed", 0.4)
+
+        self.cols = width // self.cell_w + 2
+        self.rows = height // self.cell_h + 2
+        # u: corrente orizzontale, v: onda verticale, in [-1, 1]
+        self.u = [0.0] * (self.cols * self.rows)
+        self.v = [0.0] * (self.cols * self.rows)
+        self.t = 0.0
+        self.next_row = 0
+
+        for r in range(self.rows):
+            self._update_row(r)
+
+    def _update_row(self, r):
+        sin = math.sin
+        cols = self.cols
+        t_wave = self.t * self.wave_speed
+        t_drift = self.t * self.drift_speed
+        y = r * self.cell_h
+        drift = y * 0.35 + t_drift
+        u = self.u
+        v = self.v
+        i = r * cols
+        for c in range(cols):
+            x = c * self.cell_w
+            v[i + c] = sin(t_wave + x * 0.1)
+            u[i + c] = sin(drift + x * 0.02)
+
+    def step(self, dt):
+        self.t += dt
+        for _ in range(min(self.rows_per_tick, self.rows)):
+            self._update_row(self.next_row)
+            self.next_row = (self.next_row + 1) % self.rows
+
+    def sample(self, x, y):
+        fx = x / self.cell_w
+        fy = y / self.cell_h
+        if fx < 0:
+            fx = 0.0
+        elif fx > self.cols - 1.001:
+            fx = self.cols - 1.001
+        if fy < 0:
+            fy = 0.0
+        elif fy > self.rows - 1.001:
+            fy = self.rows - 1.001
+
+        c0 = int(fx)
+        r0 = int(fy)
+        tx = fx - c0
+        ty = fy - r0
+        i = r0 * self.cols + c0
+        j = i + self.cols
+
+        u = self.u
+        v = self.v
+        su = (u[i] + (u[i + 1] - u[i]) * tx) * (1 - ty) + (u[j] + (u[j + 1] - u[j]) * tx) * ty
+        sv = (v[i] + (v[i + 1] - v[i]) * tx) * (1 - ty) + (v[j] + (v[j + 1] - v[j]) * tx) * ty
+        return su, sv
+
+current_field = CurrentField(40, 120)
 
 
 class Bubble:
@@ -262,7 +919,9 @@ class Bubble:
         self.y += self.vy * dt * 60
         self.x += self.vx * dt * 60
 
-        self.vx += random.uniform(-0.005, 0.005)
+        # la bolla segue la corrente invece di una camminata casuale
+        u, _ = current_field.sample(self.x, self.y)
+        self.vx += (u * 0.06 - self.vx) * min(1.0, 0.05 * dt * 60)
         self.vx = max(min(self.vx, 0.08), -0.08)
 
         if self.y < 0 or self.x < 0 or self.x > self.max_x - 1:
@@ -281,7 +940,9 @@ class Bubble:
 FLIP_MAP = str.maketrans("()[]{}<>/\\", ")(][}{><\\/")
 
 def flip_line(line):
-    return line[::-1].translate(FLIP_MAP)
+    # si rovesciano le celle, non i codepoint: i segni combinanti restano
+    # dopo il loro carattere base
+    return "".join(split_cells(line)[::-1]).translate(FLIP_MAP)
 
 def assign_school(fish, fish_list):
     cfg = fish.school_cfg
@@ -315,6 +976,7 @@ class Fish:
         self.cfg = cfg
         self.school_cfg = self.cfg.get("schooling", {})
         self.movement_cfg = self.cfg.get("movement", {})
+        self.interaction_cfg = self.cfg.get("interaction", {})
         self.school_id = None
         self.reset()
 
@@ -340,6 +1002,7 @@ class Fish:
 
         self.rgb_fg = self.cfg.get("rgb_fg")
         self.rgb_bg = self.cfg.get("rgb_bg")
+        self.layer = self.cfg.get("layer", "mid")
 
         self.speed = self.cfg["speed"]
         self.role = self.cfg.get("role", "prey")
@@ -351,7 +1014,7 @@ class Fish:
         self.height = len(self.shape)
         self.height = max(1, self.height)
 
-        self.width = max(len(row) for row in self.shape)
+        self.width = max(line_width(row) for row in self.shape)
         self.width = max(1, self.width)
 
         if self.preferred_depth == "bottom":
@@ -368,6 +1031,14 @@ class Fish:
         self.age = 0.0
         self.breed_cooldown = random.uniform(5.0, 15.0)
 
+        self.frame_runs = None
+        self.placed_key = None
+        self.placed = ()
+
+        self.other = None
+        self.interact_timer = random.uniform(0.0, 0.4)
+        self.turn_cooldown = 0.0
+
         if self.direction == "left" and self.flip_allowed:
             self._flip_all_frames()
 
@@ -377,6 +1048,7 @@ class Fish:
             return [flip_line(row) for row in frame]
         self.base_frames = [flip_frame(frame) for frame in self.base_frames]
         self.shape = self.base_frames[self.anim_index]
+        self.frame_runs = None
 
     def _flip_direction(self):
         if not self.flip_allowed:
@@ -394,7 +1066,7 @@ class Fish:
             self.anim_index = (self.anim_index + 1) % len(self.base_frames)
             self.shape = self.base_frames[self.anim_index]
 
-    def schooling(self, fish_list):
+    def schooling(self, fish_list, grid=None):
         if self.preferred_depth == "bottom" or self.name_specie == "jelly":
             return
 
@@ -417,8 +1089,12 @@ class Fish:
         WAVE_STRENGTH = cfg.get("wave_strength", 0.15)
         LANE_LOCK = cfg.get("lane_lock", True)
 
+        candidates = fish_list
+        if grid is not None:
+            candidates = grid.query(self.x, self.y, NEIGHBOR_RADIUS_X, NEIGHBOR_RADIUS_Y)
+
         neighbors = [
-            f for f in fish_list
+            f for f in candidates
             if f is not self
             and not f.dead
             and f.name == self.name
@@ -483,7 +1159,7 @@ class Fish:
 
 
         
-        self.y += math.sin(time.time() * WAVE_SPEED + self.x * 0.1) * WAVE_STRENGTH 
+        self.y += current_field.sample(self.x, self.y)[1] * WAVE_STRENGTH 
 
         
         self.y += random.uniform(-JITTER_AMOUNT, JITTER_AMOUNT)
@@ -574,13 +1250,124 @@ class Fish:
         self.shape = self.base_frames[self.anim_index]
 
         
-        self.x += math.sin(time.time() * 0.4 + self.y) * 0.015
+        self.x += current_field.sample(self.x, self.y)[0] * 0.015
 
       
         self.x %= max(1, self.max_x - self.width)
 
 
-    def update(self, dt, fish_list):
+    def interact(self, grid, dt):
+        # prede che scappano dai predatori, predatori che inseguono le prede.
+        # La ricerca sulla griglia si fa solo ogni tanto e solo se il budget
+        # del frame non e' finito; negli altri frame si usa l'ultima scelta.
+        if self.role not in ("prey", "predator"):
+            return
+
+        c = self.interaction_cfg
+        cx = self.x + self.width / 2
+        cy = self.y + self.height / 2
+
+        self.interact_timer -= dt
+        self.turn_cooldown -= dt
+        if self.interact_timer <= 0 and grid.take_query():
+            self.interact_timer = random.uniform(0.2, 0.4)
+            if self.role == "prey":
+                rx = c.get("flee_radius_x", 20)
+                ry = c.get("flee_radius_y", 5)
+                found = [
+                    f for f in grid.query(self.x, self.y, rx, ry)
+                    if f.role == "predator" and f is not self
+                ]
+            else:
+                rx = c.get("hunt_radius_x", 40)
+                ry = c.get("hunt_radius_y", 8)
+                size = self.width * self.height
+                found = [
+                    f for f in grid.query(self.x, self.y, rx, ry)
+                    if f.role == "prey" and f.width * f.height < size
+                ]
+            self.other = min(
+                found,
+                key=lambda f: abs(f.x + f.width / 2 - cx) + abs(f.y + f.height / 2 - cy),
+                default=None
+            )
+
+        other = self.other
+        if other is None or other.dead:
+            self.other = None
+            return
+
+        ox = other.x + other.width / 2
+        oy = other.y + other.height / 2
+
+        if self.role == "prey":
+            want = "left" if ox > cx else "right"
+            self.y += (1 if cy >= oy else -1) * c.get("flee_force_y", 0.08)
+        else:
+            want = "right" if ox > cx else "left"
+            self.y += (oy - cy) * c.get("chase", 0.03)
+
+        # niente avanti e indietro quando l'altro e' quasi sopra/sotto
+        if abs(ox - cx) < (self.width + other.width) / 2:
+            want = self.direction
+
+        if want != self.direction and self.turn_cooldown <= 0:
+            self._flip_direction()
+            self.intent_dir = want
+            self.turn_cooldown = random.uniform(1.0, 2.0)
+
+        self.y = max(1, min(self.y, self.visible_y - self.height - 2))
+
+
+    def avoid_obstacles(self, dt):
+        # le celle che il pesce copre piu' quelle che attraversera' nel
+        # prossimo frame: se c'e' scenografia si sposta verso le righe libere
+        # piu' vicine, un passo per frame, finche' non e' tutto libero
+        cols = len(scene_obstacles[0])
+        reach = max(2, int(self.speed * dt * 35) + 1)
+        ix = int(self.x)
+        if self.direction == "right":
+            x0, x1 = ix, ix + self.width + reach
+        else:
+            x0, x1 = ix - reach, ix + self.width
+        x0 = max(0, x0)
+        x1 = min(cols, x1)
+        if x0 >= x1:
+            return
+
+        rows = len(scene_obstacles)
+
+        def blocked(top):
+            for yy in range(max(0, top), min(rows, top + self.height)):
+                if scene_obstacles[yy].find(1, x0, x1) >= 0:
+                    return True
+            return False
+
+        iy = int(self.y)
+        if not blocked(iy):
+            return
+
+        low = 1
+        high = self.visible_y - self.height - 2
+        target = None
+        for d in range(1, high - low + 1):
+            for top in (iy - d, iy + d):
+                if low <= top <= high and not blocked(top):
+                    target = top
+                    break
+            if target is not None:
+                break
+        if target is None:
+            return
+
+        step = 0.35 * dt * 60
+        if target < iy:
+            self.y = max(target, self.y - step)
+        else:
+            self.y = min(target, self.y + step)
+
+
+    def update(self, dt, fish_list, grid=None):
         self.age += dt
         self.breed_cooldown -= dt
 
@@ -593,13 +1380,19 @@ class Fish:
         if self.name_specie == "jelly":
             self.jellyfish_movement(dt)
         else:
-            self.schooling(fish_list)
+            self.schooling(fish_list, grid)
 
         
         if self.school_id in school_directions:
             bank_dir = school_directions[self.school_id]
             self.intent_dir = "right" if bank_dir > 0 else "left"
 
+        if grid is not None:
+            self.interact(grid, dt)
+
+        if scene_occupancy and self.preferred_depth != "bottom" and self.name_specie != "jelly":
+            self.avoid_obstacles(dt)
+
         
         dx = self.speed * dt * 35 
 
@@ -618,43 +1411,163 @@ class Fish:
         if self.preferred_depth == "bottom":
             self.y = self.visible_y - self.height - 1
 
-    def can_breed(self, current_population):
+    def can_breed(self, current_population, population_scale=1.0):
         if self.breed_cooldown > 0:
             return False
-        if current_population >= self.max_population:
+        if current_population >= max(1, int(self.max_population * population_scale)):
             return False
         return random.random() < 0.02
 
-    def erase(self, renderer, static_layer):
-        for dy in range(self.height):
-            #for dx in range(self.shape):
-            for dx in range(self.width):
-                px = int(self.x) + dx
-                py = int(self.y) + dy
-                if 0 <= px < renderer.w and 0 <= py < renderer.h:
-                    ch, fg_code, bg_code = static_layer[py][px]
-                    renderer.set_cell(py, px, ch, fg_code, bg_code)
-
-
     def draw(self, renderer):
         if self.dead:
-            '''px = int(self.x) + dx
-            py = int(self.y) + dy
-            if 0 <= px < renderer.w and 0 <= py < renderer.h:
-                renderer.set_cell(py, px, " ", "", "")'''
             return
 
-        fg_code = fg(*self.rgb_fg) if self.rgb_fg else ""
-        bg_code = bg(*self.rgb_bg) if self.rgb_bg else ""
+        if self.frame_runs is None:
+            fg_code = fg(*self.rgb_fg) if self.rgb_fg else ""
+            bg_code = bg(*self.rgb_bg) if self.rgb_bg else ""
+            self.frame_runs = [
+                rasterize_sprite(frame, fg_code, bg_code) for frame in self.base_frames
+            ]
+
+        runs = self.frame_runs[self.anim_index]
+        ix = int(self.x)
+        iy = int(self.y)
+
+        # stessa posizione intera e stesso frame: gli span gia' tagliati si riusano
+        key = (ix, iy, runs, renderer)
+        if key != self.placed_key:
+            self.placed_key = key
+            self.placed = clip_runs(runs, iy, ix, renderer.h, renderer.w, scene_cover.get(self.layer))
+
+        back = renderer.back
+        for py, x0, x1, cells in self.placed:
+            back[py][x0:x1] = cells
+
+
+# ---------- SPRITE CACHE ----------
+# per ogni frame di sprite (e colore) le celle opache sono salvate una volta
+# sola come run orizzontali: (dy, dx, celle). Sono tuple condivise tra tutti
+# i pesci della stessa specie e non vengono mai modificate.
+sprite_cache = {}
+
+def rasterize_sprite(frame, fg_code, bg_code):
+    key = (tuple(frame), fg_code, bg_code)
+    runs = sprite_cache.get(key)
+    if runs is not None:
+        return runs
+
+    runs = []
+    for dy, line in enumerate(frame):
+        line = split_cells(line)
+        dx = 0
+        n = len(line)
+        while dx < n:
+            if line[dx] == " ":
+                dx += 1
+                continue
+            start = dx
+            while dx < n and line[dx] != " ":
+                dx += 1
+            cells = tuple((ch, fg_code, bg_code) for ch in line[start:dx])
+            runs.append((dy, start, cells))
+
+    runs = tuple(runs)
+    sprite_cache[key] = runs
+    return runs
+
+def trim_wide(cells, c0, c1):
+    # un taglio non lascia meta' di un carattere largo
+    if c0 < c1 and cells[c0][0] == WIDE_TAIL:
+        c0 += 1
+    if c0 < c1 < len(cells) and cells[c1][0] == WIDE_TAIL:
+        c1 -= 1
+    return c0, c1
+
+def clip_runs(runs, y, x, h, w, cover=None):
+    # taglia le run sui bordi del renderer e, se c'e' la mappa di copertura
+    # del layer (scene_cover), toglie le celle coperte dalla scenografia davanti
+    placed = []
+    for dy, dx, cells in runs:
+        py = y + dy
+        if py < 0 or py >= h:
+            continue
+        x0 = x + dx
+        x1 = x0 + len(cells)
+        if x1 <= 0 or x0 >= w:
+            continue
+        c0 = 0
+        if x0 < 0:
+            c0 = -x0
+            x0 = 0
+        if x1 > w:
+            x1 = w
+
+        # colonna sullo schermo = indice della cella + off
+        off = x0 - c0
+        row_occ = cover[py] if cover and py < len(cover) else None
+        if row_occ is None or row_occ.find(1, x0, x1) < 0:
+            a, b = trim_wide(cells, c0, x1 - off)
+            if a < b:
+                placed.append((py, a + off, b + off, cells[a:b]))
+            continue
+
+        start = None
+        for px in range(x0, x1 + 1):
+            hidden = px == x1 or row_occ[px]
+            if hidden and start is not None:
+                a, b = trim_wide(cells, start - off, px - off)
+                if a < b:
+                    placed.append((py, a + off, b + off, cells[a:b]))
+                start = None
+            elif not hidden and start is None:
+                start = px
+    return tuple(placed)
+
+# ---------- GRIGLIA SPAZIALE ----------
+class SpatialGrid:
+    # ricostruita a ogni frame con tutti i pesci vivi, condivisa da tutte le
+    # specie: ogni ricerca guarda solo le celle vicine invece di tutta la lista
+    def __init__(self, fish_list, cfg=None):
+        cfg = cfg or {}
+        self.cell_w = cfg.get("cell_w", 16)
+        self.cell_h = cfg.get("cell_h", 6)
+        self.budget = cfg.get("max_queries_per_frame", 64)
+        self.cells = {}
+
+        cw = self.cell_w
+        ch = self.cell_h
+        cells = self.cells
+        for f in fish_list:
+            if f.dead:
+                continue
+            key = (int(f.x // cw), int(f.y // ch))
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [f]
+            else:
+                bucket.append(f)
+
+    def take_query(self):
+        if self.budget <= 0:
+            return False
+        self.budget -= 1
+        return True
+
+    def query(self, x, y, rx, ry):
+        # pesci (con x, y in alto a sinistra) entro rx, ry da (x, y)
+        cw = self.cell_w
+        ch = self.cell_h
+        cells = self.cells
+        found = []
+        for gy in range(int((y - ry) // ch), int((y + ry) // ch) + 1):
+            for gx in range(int((x - rx) // cw), int((x + rx) // cw) + 1):
+                bucket = cells.get((gx, gy))
+                if bucket:
+                    for f in bucket:
+                        if abs(f.x - x) < rx and abs(f.y - y) < ry:
+                            found.append(f)
+        return found
 
-        for dy, line in enumerate(self.shape):
-            for dx, ch in enumerate(line):
-                if ch == " ":
-                    continue
-                px = int(self.x) + dx
-                py = int(self.y) + dy
-                if 0 <= px < renderer.w and 0 <= py < renderer.h:
-                    renderer.set_cell(py, px, ch, fg_code, bg_code)
 
 def overlaps(x, width, occupied):
     for ox1, ox2 in occupied:
@@ -798,48 +1711,687 @@ def find_free_x_position(
     return int(max(xmin, min(cluster_center - width / 2, xmax)))
 
 
-def bubble_intro(renderer, static_layer, visible_y, visible_x,timesleep=0.05):
-    bubbles = []
-    for x in range(visible_x):
-        bubbles.append({
-            "x": x,
-            "y": visible_y + random.randint(0, 3),
-            "char": random.choice(["o", "O", ".", "0", "°"])
-        })
+class IntroBubbles:
+    # una colonna di bolle che sale dal fondo: bloccante prima del primo
+    # frame (bubble_intro) oppure disegnata sopra l'acquario gia' vivo
+    def __init__(self, visible_y, visible_x):
+        self.bubbles = []
+        for x in range(visible_x):
+            self.bubbles.append({
+                "x": x,
+                "y": visible_y + random.randint(0, 3),
+                "char": random.choice(["o", "O", ".", "0", "°"])
+            })
+        self.step = 0
+        self.steps = visible_y + 3
 
-    steps = visible_y + 3
+    @property
+    def done(self):
+        return self.step >= self.steps
 
-    for step in range(steps):
-        renderer.clear_back()
-        renderer.blit_static_layer(static_layer)
+    def advance(self):
+        self.step += 1
 
-        for b in bubbles:
-            yy = b["y"] - step
-            if 0 <= yy < visible_y:
+    def draw(self, renderer):
+        for b in self.bubbles:
+            yy = b["y"] - self.step
+            if 0 <= yy < renderer.h:
                 renderer.set_cell(yy, b["x"], b["char"])
 
+
+def bubble_intro(renderer, compositor, visible_y, visible_x,timesleep=0.05):
+    intro = IntroBubbles(visible_y, visible_x)
+
+    while not intro.done:
+        compositor.compose(renderer, {"hud": [intro]})
         renderer.flush(force=False)
+        intro.advance()
         time.sleep(timesleep)
 
 
-def sweep_bottom(renderer, static_layer, visible_y, visible_x):
-    for y in range(visible_y - 2, visible_y):  
-        for x in range(visible_x):
-            ch, fg_code, bg_code = static_layer[y][x]
-            if ch in [" ", "_", "_-", ":-", "-", "~", "^", "`"]:
-                
-                renderer.front[y][x] = ("","","")
-                renderer.set_cell(y, x, ch, fg_code, bg_code)
-                
+# ---------- PROFILING ----------
+PROFILED_METHODS = [
+    (Fish, "update"),
+    (Fish, "schooling"),
+    (Fish, "jellyfish_movement"),
+    (Fish, "interact"),
+    (Fish, "draw"),
+    (Bubble, "update"),
+    (CurrentField, "step"),
+    (Renderer, "flush"),
+]
+# metodi sommati nei totali per specie: update include gia'
+# schooling/jellyfish_movement/interact. Un metodo nuovo in
+# PROFILED_METHODS va qui se non e' chiamato da uno di questi.
+PROFILED_TOTALS = ("Fish.update", "Fish.draw", "Bubble.update", "CurrentField.step", "Renderer.flush")
+
+class Profiler:
+    # "t": tempi cumulativi e numero di chiamate per specie
+    # "p": finestra di cattura cProfile salvata in un file .prof
+    # quando e' spento i metodi originali non vengono toccati: overhead zero
+    def __init__(self):
+        self.timing = False
+        self.stats = {}
+        self.originals = {}
+        self.capture = None
+        self.written = []
+
+    def _wrap(self, cls, name, func):
+        stats = self.stats
+        perf = time.perf_counter
+        label = f"{cls.__name__}.{name}"
+        default = cls.__name__.lower()
+
+        def timed(obj, *args, **kwargs):
+            t0 = perf()
+            try:
+                return func(obj, *args, **kwargs)
+            finally:
+                key = (getattr(obj, "name", default), label)
+                entry = stats.get(key)
+                if entry is None:
+                    entry = stats[key] = [0, 0.0]
+                entry[0] += 1
+                entry[1] += perf() - t0
+        return timed
+
+    def toggle_timing(self):
+        if self.timing:
+            self.stop_timing()
+        else:
+            self.start_timing()
+
+    def start_timing(self):
+        if self.timing:
+            return
+        self.stats.clear()
+        for cls, name in PROFILED_METHODS:
+            func = cls.__dict__[name]
+            self.originals[(cls, name)] = func
+            setattr(cls, name, self._wrap(cls, name, func))
+        self.timing = True
+        self.timing_start = time.perf_counter()
+
+    def stop_timing(self):
+        if not self.timing:
+            return
+        for (cls, name), func in self.originals.items():
+            setattr(cls, name, func)
+        self.originals.clear()
+        self.timing = False
+        elapsed = time.perf_counter() - self.timing_start
+        path = time.strftime("acquarium_timing_%Y%m%d-%H%M%S.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.report(elapsed))
+        self.written.append(path)
+
+    def report(self, elapsed):
+        lines = [f"window: {elapsed:.2f}s", ""]
+
+        per_species = {}
+        for (who, label), (calls, total) in self.stats.items():
+            if label in PROFILED_TOTALS:
+                per_species[who] = per_species.get(who, 0.0) + total
+
+        lines.append(f"{'species':<16}{'total ms':>12}{'% window':>10}")
+        for who, total in sorted(per_species.items(), key=lambda kv: -kv[1]):
+            lines.append(f"{who:<16}{total * 1000:>12.2f}{total / max(elapsed, 1e-9) * 100:>9.1f}%")
+
+        lines.append("")
+        lines.append(f"{'species':<16}{'method':<26}{'calls':>10}{'total ms':>12}{'us/call':>10}")
+        for (who, label), (calls, total) in sorted(self.stats.items(), key=lambda kv: -kv[1][1]):
+            lines.append(
+                f"{who:<16}{label:<26}{calls:>10}{total * 1000:>12.2f}{total / calls * 1e6:>10.1f}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def toggle_capture(self):
+        if self.capture is not None:
+            self.stop_capture()
+        else:
+            self.start_capture()
+
+    def start_capture(self):
+        import cProfile
+        self.capture = cProfile.Profile()
+        self.capture.enable()
+
+    def stop_capture(self):
+        if self.capture is None:
+            return
+        self.capture.disable()
+        path = time.strftime("acquarium_%Y%m%d-%H%M%S.prof")
+        self.capture.dump_stats(path)
+        self.capture = None
+        self.written.append(path)
+
+    def stop_all(self):
+        self.stop_capture()
+        self.stop_timing()
+
+    def status(self):
+        parts = []
+        if self.timing:
+            parts.append("[t] timing")
+        if self.capture is not None:
+            parts.append("[p] cProfile")
+        return "  ".join(parts)
+
+profiler = Profiler()
+
+
+# ---------- SERVER MULTI-TERMINALE ----------
+# una sola simulazione, tanti client leggeri: il server manda a ogni client
+# lo stesso stream di escape prodotto da Renderer.flush (cioe' le differenze
+# tra un frame e l'altro). Chi si collega, o resta troppo indietro, riceve
+# un keyframe completo al posto della coda accumulata.
+def parse_address(addr):
+    import socket
+    if addr.startswith("unix:"):
+        return socket.AF_UNIX, addr[len("unix:"):]
+    host, _, port = addr.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+class TankClient:
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = bytearray()
+        self.need_keyframe = True
+
+
+class FrameServer:
+    def __init__(self, addr):
+        import socket
+        family, address = parse_address(addr)
+        self.unix = family == socket.AF_UNIX
+        self.address = address
+        if self.unix and os.path.exists(address):
+            # solo un socket rimasto da un server precedente: mai altri file
+            import stat
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise ValueError(f"{address} esiste e non e' un socket: scegli un altro indirizzo")
+            os.unlink(address)
+
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        if not self.unix:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(address)
+        self.sock.listen()
+        self.sock.setblocking(False)
+        self.clients = []
+
+    def attach(self, renderer):
+        # nuovo renderer (avvio o reload): tutti ripartono da un keyframe
+        renderer.listeners.append(self)
+        for c in self.clients:
+            c.need_keyframe = True
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            self.clients.append(TankClient(sock))
+
+    def frame_flushed(self, renderer, data):
+        self._accept()
+        keyframe = None
+
+        for c in list(self.clients):
+            if c.need_keyframe:
+                if keyframe is None:
+                    keyframe = renderer.keyframe()
+                c.pending[:] = keyframe
+                c.need_keyframe = False
+            else:
+                c.pending += data
+
+            try:
+                while c.pending:
+                    sent = c.sock.send(c.pending)
+                    del c.pending[:sent]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                self._drop(c)
+                continue
+
+            # client lento: appena la coda supera un keyframe (che e' lungo
+            # almeno h*w byte) la si sostituisce con il keyframe
+            if len(c.pending) > renderer.h * renderer.w:
+                if keyframe is None:
+                    keyframe = renderer.keyframe()
+                if len(c.pending) > len(keyframe):
+                    c.pending[:] = keyframe
+
+    def _drop(self, c):
+        self.clients.remove(c)
+        try:
+            c.sock.close()
+        except OSError:
+            pass
+
+    def close(self):
+        for c in list(self.clients):
+            self._drop(c)
+        self.sock.close()
+        if self.unix and os.path.exists(self.address):
+            import stat
+            if stat.S_ISSOCK(os.stat(self.address).st_mode):
+                os.unlink(self.address)
+
+
+def run_client(addr):
+    import select
+    import socket
+    family, address = parse_address(addr)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(address)
+
+    enable_raw_mode()
+    sys.stdout.write(CLEAR + move(1, 1) + HIDE_CURSOR)
+    sys.stdout.flush()
+    writer = FdWriter()
+
+    try:
+        while True:
+            if key_pressed() and get_key() == "q":
+                break
+            dr, _, _ = select.select([sock], [], [], 0.05)
+            if dr:
+                data = sock.recv(1 << 16)
+                if not data:
+                    break
+                writer.write(data)
+    finally:
+        sock.close()
+        disable_raw_mode()
+        sys.stdout.write(RESET + SHOW_CURSOR + CLEAR + move(1, 1))
+        sys.stdout.flush()
+
 
-def main():
-    config,renderer, static_layer, fish_list, bubbles,visible_y,visible_x,world_y,world_x = load_acq()
+# ---------- RISPARMIO ENERGETICO ----------
+def terminal_in_background():
+    # processo mandato in background dalla shell (es. ctrl+z / bg)
+    if WINDOWS:
+        return False
+    try:
+        fd = sys.stdout.fileno()
+        return os.isatty(fd) and os.tcgetpgrp(fd) != os.getpgrp()
+    except (OSError, ValueError):
+        return False
+
+def parse_clock(text):
+    h, m = text.split(":")
+    return int(h) * 60 + int(m)
+
+
+class PowerManager:
+    # decide quanto dormire tra un frame e l'altro e quanti pesci/bolle
+    # tenere attivi, per restare dentro "cpu_budget" (frazione di un core)
+    def __init__(self, cfg=None):
+        cfg = cfg or {}
+        self.max_fps = cfg.get("max_fps", 20)
+        self.min_fps = cfg.get("min_fps", 2)
+        self.cpu_budget = cfg.get("cpu_budget", 0.25)
+        self.night = cfg.get("night")
+        for key in ("max_fps", "min_fps", "cpu_budget"):
+            if not getattr(self, key) > 0:
+                raise ValueError(f"power.{key} deve essere maggiore di 0, non {getattr(self, key)!r}")
+        if self.night and not self.night.get("max_fps", 5) > 0:
+            raise ValueError("power.night.max_fps deve essere maggiore di 0")
+
+        self.cpu_usage = 0.0
+        self.fps = 0.0
+        self.load_scale = 1.0
+        self.population_scale = 1.0
+        self.bubble_scale = 1.0
+        self.mode = "full"
+
+        self.last_wall = None
+        self.last_cpu = 0.0
+        self.frame_start = time.perf_counter()
+        self.last_blocked = 0.0
+        self.slow_until = 0.0
+        self.next_check = 0.0
+        self.background = False
+        self.night_active = False
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        cpu = time.process_time()
+        if self.last_wall is not None:
+            wall = now - self.last_wall
+            if wall > 0:
+                self.cpu_usage += ((cpu - self.last_cpu) / wall - self.cpu_usage) * 0.1
+                self.fps += (1 / wall - self.fps) * 0.1
+        self.last_wall = now
+        self.last_cpu = cpu
+        self.frame_start = now
+
+    def _in_night(self):
+        if not self.night:
+            return False
+        t = time.localtime()
+        now = t.tm_hour * 60 + t.tm_min
+        start = parse_clock(self.night.get("start", "22:00"))
+        end = parse_clock(self.night.get("end", "07:00"))
+        if start <= end:
+            return start <= now < end
+        return now >= start or now < end
+
+    def end_frame(self, renderer):
+        now = time.perf_counter()
+        work_cpu = time.process_time() - self.last_cpu
+
+        if now >= self.next_check:
+            self.next_check = now + 1.0
+            self.background = terminal_in_background()
+            self.night_active = self._in_night()
+
+        # stdout che blocca: il terminale non sta dietro, rallenta per un po'
+        writer = getattr(renderer.backend, "writer", None)
+        if writer is not None:
+            if writer.blocked_time > self.last_blocked:
+                self.slow_until = now + 2.0
+            self.last_blocked = writer.blocked_time
+
+        max_fps = self.max_fps
+        target_scale = 1.0
+        bubble_target = 1.0
+        if self.night_active:
+            max_fps = min(max_fps, self.night.get("max_fps", 5))
+            target_scale = self.night.get("population_scale", 0.5)
+            bubble_target = self.night.get("bubble_scale", 0.3)
+
+        slowest = 1 / self.min_fps
+        interval = max(1 / max_fps, work_cpu / self.cpu_budget)
+        if self.background or now < self.slow_until:
+            interval = slowest
+            self.mode = "background" if self.background else "blocked"
+        elif self.night_active:
+            self.mode = "night"
+        else:
+            self.mode = "full"
+
+        # anche al minimo degli fps si sfora il budget: meno pesci e bolle
+        if work_cpu / slowest > self.cpu_budget:
+            self.load_scale = max(0.2, self.load_scale * 0.98)
+        elif self.cpu_usage < self.cpu_budget * 0.6:
+            self.load_scale = min(1.0, self.load_scale + 0.005)
+        interval = min(interval, slowest)
+
+        self.population_scale = min(target_scale, self.load_scale)
+        self.bubble_scale = min(bubble_target, self.load_scale)
+
+        return max(0.0, interval - (now - self.frame_start))
+
+    def status(self):
+        return f"{self.mode} {self.fps:4.1f}fps cpu {self.cpu_usage * 100:4.1f}%"
+
+
+# ---------- UN FRAME DI SIMULAZIONE ----------
+def simulate(config, renderer, compositor, fish_list, bubbles, visible_y, world_y, world_x, dt,
+             population_scale=1.0, bubble_scale=1.0, hud="", overlays=()):
+    current_field.step(dt)
+
+    active_bubbles = bubbles[:int(len(bubbles) * bubble_scale)]
+    for b in active_bubbles:
+        b.update(dt)
+
+   
+    pop_counts = {}
+    for f in fish_list:
+        if not f.dead:
+            pop_counts[f.name] = pop_counts.get(f.name, 0) + 1
+
+    # popolazione ridotta (notte o cpu): un pesce in piu' per specie se ne va
+    if population_scale < 1.0:
+        for f in fish_list:
+            if f.dead:
+                continue
+            cap = max(1, int(f.max_population * population_scale))
+            if pop_counts[f.name] > cap:
+                f.dead = True
+                pop_counts[f.name] = cap
+
+    
+    grid = SpatialGrid(fish_list, config.get("interactions"))
+    for f in fish_list:
+        if not f.dead:
+            f.update(dt, fish_list, grid)
+
+    
+    for sid in list(school_directions.keys()):
+        if random.random() < 0.001:
+            school_directions[sid] *= -1
+
+   
+    new_fish = []
+    for f in fish_list:
+        if f.dead:
+            continue
+        current_pop = pop_counts.get(f.name, 0)
+        if f.can_breed(current_pop, population_scale):
+            baby = Fish(world_y, world_x, f.cfg, visible_y)
+            baby.x = f.x + random.uniform(-5, 5)
+            baby.y = f.y + random.uniform(1, 2)
+            baby.breed_cooldown = random.uniform(10.0, 20.0)
+            baby.school_id = assign_school(baby, fish_list)
+            if baby.school_id not in school_directions:
+                school_directions[baby.school_id] = random.choice([-1, 1])
+
+            new_fish.append(baby)
+            pop_counts[f.name] = current_pop + 1
+            f.breed_cooldown = random.uniform(10.0, 20.0)
+
+    fish_list.extend(new_fish)
+    fish_list = [f for f in fish_list if not (f.dead and random.random() < 0.1)]
+
+  
+    sprites = {"bubbles": active_bubbles}
+    for f in fish_list:
+        if not f.dead and 0 <= f.y < visible_y:
+            sprites.setdefault(f.layer, []).append(f)
+    if overlays:
+        sprites.setdefault("hud", []).extend(overlays)
+
+    compositor.set_hud(hud)
+    compositor.compose(renderer, sprites)
+    renderer.flush(force=False)
+    return fish_list
+
+
+def sgr_key(code):
+    # "\033[38;2;1;2;3m" -> "38;2;1;2;3": i colori come parametri SGR, senza escape
+    return code[2:-1] if code else ""
+
+
+# ---------- FRAMEBUFFER CONDIVISO ----------
+# il frame composto (codepoint + id di stile per cella) pubblicato in un file
+# mappato in memoria, per screenshot, anteprime web, sonde di monitoraggio...
+#
+#   header (64 byte): magic, h, w, buffer attivo, numero stili, seq
+#   tabella stili:    MIRROR_STYLE_SLOTS slot da 64 byte "fg|bg" (vedi sgr_key)
+#   2 buffer:         h*w uint32 codepoint (0 = seconda colonna di un
+#                     carattere largo), poi h*w uint16 id di stile
+#
+# seqlock a doppio buffer: chi scrive non aspetta mai. seq e' dispari durante
+# la scrittura; il buffer attivo viene riscritto solo due frame dopo, quindi
+# una copia e' valida se seq era pari e alla fine e' avanzato al massimo di 2.
+# Chi legge deve seguire quest'ordine: seq (riprova se dispari), poi active e
+# il resto dell'header, poi la copia del buffer, infine di nuovo seq.
+MIRROR_MAGIC = b"ACQFB001"
+MIRROR_HEADER = struct.Struct("=8sIIIIQ")
+MIRROR_HEADER_SIZE = 64
+MIRROR_SEQ_OFFSET = 24
+MIRROR_STYLE_SLOTS = 1024
+MIRROR_STYLE_SIZE = 64
+MIRROR_FRAMES_OFFSET = MIRROR_HEADER_SIZE + MIRROR_STYLE_SLOTS * MIRROR_STYLE_SIZE
+
+
+class FrameMirror:
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+        self.seq = 0
+        self.h = self.w = None
+
+    def attach(self, renderer):
+        renderer.listeners.append(self)
+        self._open(renderer.h, renderer.w)
+
+    def _open(self, h, w):
+        import mmap
+        self.close()
+        self.h = h
+        self.w = w
+        cells = h * w
+        self.frame_size = cells * 6
+        size = MIRROR_FRAMES_OFFSET + 2 * self.frame_size
+
+        # file nuovo rimpiazzato in un colpo: chi legge la vecchia mappa
+        # continua a leggerla invece di trovarsi un file troncato
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(size)
+        f = open(tmp, "r+b")
+        self.mm = mmap.mmap(f.fileno(), size)
+        f.close()
+        os.replace(tmp, self.path)
+
+        self.codes = array("I", [32]) * cells
+        self.style_ids = array("H", [0]) * cells
+        self.rows = [None] * h
+        self.styles = {}
+        self.active = 0
+        MIRROR_HEADER.pack_into(self.mm, 0, MIRROR_MAGIC, h, w, 0, 0, self.seq)
+
+    def _style_id(self, fg_code, bg_code):
+        key = (fg_code, bg_code)
+        sid = self.styles.get(key)
+        if sid is None:
+            sid = len(self.styles)
+            if sid >= MIRROR_STYLE_SLOTS:
+                return 0
+            self.styles[key] = sid
+            text = f"{sgr_key(fg_code)}|{sgr_key(bg_code)}".encode()[:MIRROR_STYLE_SIZE]
+            off = MIRROR_HEADER_SIZE + sid * MIRROR_STYLE_SIZE
+            self.mm[off:off + MIRROR_STYLE_SIZE] = text.ljust(MIRROR_STYLE_SIZE, b"\0")
+            struct.pack_into("=I", self.mm, 20, len(self.styles))
+        return sid
+
+    def frame_flushed(self, renderer, data):
+        if (renderer.h, renderer.w) != (self.h, self.w):
+            self._open(renderer.h, renderer.w)
+
+        codes = self.codes
+        ids = self.style_ids
+        w = self.w
+        for y, row in enumerate(renderer.back):
+            if row == self.rows[y]:
+                continue
+            self.rows[y] = row[:]
+            base = y * w
+            row_bg = renderer.row_bg[y]
+            for x, (ch, fg_code, bg_code) in enumerate(row):
+                # 0: seconda colonna di un carattere largo
+                codes[base + x] = ord(ch[0]) if ch else 0
+                ids[base + x] = self._style_id(fg_code, bg_code or row_bg)
+
+        mm = self.mm
+        target = 1 - self.active
+        off = MIRROR_FRAMES_OFFSET + target * self.frame_size
+        split = off + len(codes) * 4
+
+        self.seq += 1
+        struct.pack_into("=Q", mm, MIRROR_SEQ_OFFSET, self.seq)
+        mm[off:split] = memoryview(codes).cast("B")
+        mm[split:off + self.frame_size] = memoryview(ids).cast("B")
+        struct.pack_into("=I", mm, 16, target)
+        self.active = target
+        self.seq += 1
+        struct.pack_into("=Q", mm, MIRROR_SEQ_OFFSET, self.seq)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+
+def read_mirror(path):
+    # restituisce (seq, righe di testo, id di stile, stili) dell'ultimo frame completo
+    import mmap
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        while True:
+            # prima seq, da solo: active va letto dopo, altrimenti si puo'
+            # prendere il buffer vecchio insieme al seq nuovo
+            seq = struct.unpack_from("=Q", mm, MIRROR_SEQ_OFFSET)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            magic, h, w, active, nstyles, _ = MIRROR_HEADER.unpack_from(mm, 0)
+            if magic != MIRROR_MAGIC:
+                raise ValueError(f"{path}: non e' un framebuffer di acquarium")
+            cells = h * w
+            off = MIRROR_FRAMES_OFFSET + active * cells * 6
+            frame = mm[off:off + cells * 6]
+            styles = [
+                mm[MIRROR_HEADER_SIZE + i * MIRROR_STYLE_SIZE:
+                   MIRROR_HEADER_SIZE + (i + 1) * MIRROR_STYLE_SIZE].rstrip(b"\0").decode()
+                for i in range(nstyles)
+            ]
+            if struct.unpack_from("=Q", mm, MIRROR_SEQ_OFFSET)[0] - seq <= 2:
+                break
+    finally:
+        mm.close()
+
+    codes = array("I")
+    codes.frombytes(frame[:cells * 4])
+    ids = array("H")
+    ids.frombytes(frame[cells * 4:])
+    lines = ["".join(map(chr, filter(None, codes[y * w:(y + 1) * w]))) for y in range(h)]
+    return seq, lines, ids, styles
+
+
+def start_intro(opts, renderer, compositor, visible_y, visible_x):
+    # "full" blocca finche' le bolle non sono salite, "background" restituisce
+    # l'intro da disegnare sopra l'acquario gia' vivo, un passo per frame
+    if opts["intro"] == "full":
+        bubble_intro(renderer, compositor, visible_y, visible_x,timesleep=0.0002)
+    elif opts["intro"] == "background":
+        return IntroBubbles(visible_y, visible_x)
+    return None
+
+
+def main(server=None, mirror=None):
+    global first_frame_time
+    config = load_config()
+    opts = startup_options(config)
+    # prima di load_acq: un "power" sbagliato deve fermarsi qui, non con il
+    # terminale gia' in raw mode e il cursore nascosto
+    power = PowerManager(config.get("power"))
+    config,renderer, compositor, fish_list, bubbles,visible_y,visible_x,world_y,world_x = load_acq(
+        config, scene_cache=opts["scene_cache"], defer_spawn=opts["defer_spawn"])
+    if server:
+        server.attach(renderer)
+    if mirror:
+        mirror.attach(renderer)
     last_time = time.time() 
+    show_power = False
+    if config.get("profiling", False):
+        profiler.start_timing()
     #renderer=Renderer(visible_y, visible_x)  
-    bubble_intro(renderer, static_layer, visible_y, visible_x,timesleep=0.0002)
+    intro = start_intro(opts, renderer, compositor, visible_y, visible_x)
 
     try:
         while True:
+            power.begin_frame()
             now = time.time()
             dt = now - last_time
             last_time = now
@@ -848,88 +2400,113 @@ def main():
                 key = get_key()
                 if key == "q":
                     break
+                elif key == "t":
+                    profiler.toggle_timing()
+                elif key == "p":
+                    profiler.toggle_capture()
+                elif key == "i":
+                    show_power = not show_power
                 elif key == "r":
-                    config,renderer,static_layer, fish_list, bubbles,visible_y,visible_x,world_y,world_x = load_acq()
+                    config = load_config()
+                    opts = startup_options(config)
+                    power = PowerManager(config.get("power"))
+                    config,renderer,compositor, fish_list, bubbles,visible_y,visible_x,world_y,world_x = load_acq(
+                        config, scene_cache=opts["scene_cache"], defer_spawn=opts["defer_spawn"])
+                    if server:
+                        server.attach(renderer)
+                    if mirror:
+                        mirror.attach(renderer)
                     #renderer=Renderer(visible_y, visible_x)
                    
                     renderer.front = [[None for _ in range(visible_x)] for _ in range(visible_y)]  
-                    bubble_intro(renderer, static_layer, visible_y, visible_x,timesleep=0.0002)
-                    renderer.clear_back()
-                    renderer.blit_static_layer(static_layer)
+                    intro = start_intro(opts, renderer, compositor, visible_y, visible_x)
+                    compositor.compose(renderer)
                     renderer.flush(force=True)
 
-            renderer.clear_back()
-            renderer.blit_static_layer(static_layer)
-
-            
-            for b in bubbles:
-                b.update(dt)
-                b.draw(renderer)
-
-           
-            pop_counts = {}
-            for f in fish_list:
-                if not f.dead:
-                    pop_counts[f.name] = pop_counts.get(f.name, 0) + 1
-
-            
-            for f in fish_list:
-                if not f.dead:
-                    f.update(dt, fish_list)
-
-            
-            for sid in list(school_directions.keys()):
-                if random.random() < 0.001:
-                    school_directions[sid] *= -1
-
-           
-            new_fish = []
-            for f in fish_list:
-                if f.dead:
-                    continue
-                current_pop = pop_counts.get(f.name, 0)
-                if f.can_breed(current_pop):
-                    baby = Fish(world_y, world_x, f.cfg, visible_y)
-                    baby.x = f.x + random.uniform(-5, 5)
-                    baby.y = f.y + random.uniform(1, 2)
-                    baby.breed_cooldown = random.uniform(10.0, 20.0)
-                    baby.school_id = assign_school(baby, fish_list)
-                    if baby.school_id not in school_directions:
-                        school_directions[baby.school_id] = random.choice([-1, 1])
-
-                    new_fish.append(baby)
-                    pop_counts[f.name] = current_pop + 1
-                    f.breed_cooldown = random.uniform(10.0, 20.0)
-
-            fish_list.extend(new_fish)
-            fish_list = [f for f in fish_list if not (f.dead and random.random() < 0.1)]
-
-          
-            for f in fish_list:
-                if not f.dead and 0 <= f.y < visible_y:
-                    f.draw(renderer)
+            hud = profiler.status()
+            if show_power:
+                hud = (hud + "  " + power.status()).strip()
+                if first_frame_time is not None:
+                    hud += f" primo frame {first_frame_time * 1000:.0f}ms"
+
+            fish_list = simulate(
+                config, renderer, compositor, fish_list, bubbles,
+                visible_y, world_y, world_x, dt,
+                population_scale=power.population_scale,
+                bubble_scale=power.bubble_scale,
+                hud=hud,
+                overlays=(intro,) if intro else ()
+            )
+            if first_frame_time is None:
+                first_frame_time = time.perf_counter() - START_TIME
 
-            renderer.flush(force=False)
+            if intro:
+                intro.advance()
+                if intro.done:
+                    intro = None
+            if pending_species:
+                # specie rimandate da defer_spawn: una per frame, anche durante l'intro
+                spawn_species(pending_species.pop(0), fish_list, world_y, world_x, visible_y)
 
 
-            time.sleep(0.05)
+            time.sleep(power.end_frame(renderer))
     finally:
+        if server:
+            server.close()
+        if mirror:
+            mirror.close()
+        profiler.stop_all()
         disable_raw_mode()
         sys.stdout.write(RESET + SHOW_CURSOR + CLEAR + move(1, 1))
+        for path in profiler.written:
+            sys.stdout.write(f"profilo salvato: {path}\n")
+        if first_frame_time is not None:
+            sys.stdout.write(f"primo frame dopo {first_frame_time * 1000:.0f} ms\n")
         sys.stdout.flush()
 
          
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", metavar="ADDR",
+                        help="simula una volta e manda i frame ai client (unix:/percorso o host:porta)")
+    parser.add_argument("--connect", metavar="ADDR",
+                        help="mostra un acquario servito da --serve")
+    parser.add_argument("--backend", choices=["auto", *BACKENDS],
+                        help="sovrascrive \"backend\" di config.json (null = server senza terminale)")
+    parser.add_argument("--mirror", metavar="PATH",
+                        help="pubblica ogni frame in un file mappato in memoria")
+    parser.add_argument("--peek", metavar="PATH",
+                        help="stampa il frame corrente pubblicato da --mirror")
+    parser.add_argument("--fast", action="store_true",
+                        help="avvio rapido: layout in cache, intro in sottofondo, pesci dopo il primo frame")
+    args = parser.parse_args()
+    backend_override = args.backend
+    fast_start = args.fast
+
+    if args.peek:
+        seq, lines, _, _ = read_mirror(args.peek)
+        print(f"frame seq {seq}")
+        print("\n".join(lines))
+        sys.exit(0)
+
     try:
         if os.name == "nt":
             os.system("")  
-        else:
+        elif sys.stdout.isatty() and not args.connect:
             #sys.stdout.write("\033[8;200;120t")
             sys.stdout.write("\033[8;300;400t")
             sys.stdout.flush()
     except Exception as e:
         print("Errore durante l'inizializzazione:", e)
-    main()
+
+    if args.connect:
+        run_client(args.connect)
+    else:
+        main(
+            server=FrameServer(args.serve) if args.serve else None,
+            mirror=FrameMirror(args.mirror) if args.mirror else None
+        )
 
 
 
@@ -0,0 +1,390 @@
+# controllo dei golden frame di acquarium.py, fuori dall'app (e dall'exe):
+#
+#   python golden.py --record [--ticks N] [--seed SEED]   registra il corpus
+#   python golden.py [--ticks N]                          confronta col corpus
+#
+import gzip, hashlib, json, random, sys, time
+
+from acquarium import (
+    RESET, WIDE_TAIL, Renderer, cell_width, char_width, cluster_centers, is_wide,
+    load_acq, load_config, make_backend, move, normalize_wide_row, school_directions,
+    sgr_key, simulate,
+)
+
+# confronto headless con seed fisso. --record fa girare una volta il renderer
+# di riferimento (il flush originale, una move e i colori completi per ogni
+# cella cambiata) e salva in GOLDEN_FILE, per ogni config e dimensione, le
+# config usate, Renderer.back tick per tick (come differenze dal tick prima)
+# e l'impronta del suo stream di escape, dopo aver controllato che lo stream
+# riproduca esattamente la griglia. Il controllo rifa' girare simulazione,
+# disegno e flush di oggi, riferimento compreso, e confronta con i frame
+# registrati sia Renderer.back sia lo schermo ricostruito dallo stream: una
+# riscrittura di simulate, Fish.draw, compositor o flush che cambia anche un
+# solo carattere diverge. Le simulazioni sono deterministiche, quindi una
+# corsa di N tick copre anche tutte quelle piu' corte.
+GOLDEN_FILE = "golden_frames.json.gz"
+GOLDEN_SIZES = ((24, 80), (40, 120), (50, 200))
+GOLDEN_DT = 0.05
+
+class ReferenceRenderer(Renderer):
+    def flush(self, force=False):
+        from operator import itemgetter
+        first = itemgetter(0)
+        out = []
+        for y in range(self.h):
+            if not force and None not in self.back[y] and self.back[y] == self.front[y]:
+                continue
+            glyphs = set(map(first, filter(None, self.back[y] + self.front[y])))
+            if any(cell_width(ch) != 1 for ch in glyphs):
+                # riga con caratteri larghi: si riscrive tutta, da sinistra
+                normalize_wide_row(self.back[y])
+                if force or self.back[y] != self.front[y]:
+                    self.front[y][:] = self.back[y]
+                    for x, (ch, fg_code, bg_code) in enumerate(self.back[y]):
+                        if ch != WIDE_TAIL:
+                            out.append(
+                                move(y + 1, x + 1) + RESET + fg_code + (bg_code or self.row_bg[y]) + ch + RESET
+                            )
+                continue
+
+            for x in range(self.w):
+                new_cell = self.back[y][x]
+                if new_cell is None:
+                    new_cell = (" ", "", "")
+                    self.back[y][x] = new_cell
+
+                if force or new_cell != self.front[y][x]:
+                    self.front[y][x] = new_cell
+                    ch, fg_code, bg_code = new_cell
+                    out.append(
+                        move(y + 1, x + 1) + RESET + fg_code + (bg_code or self.row_bg[y]) + ch + RESET
+                    )
+
+        data = "".join(out).encode()
+        if data:
+            self.backend.write(data)
+        for listener in self.listeners:
+            listener.frame_flushed(self, data)
+
+
+class TerminalScreen:
+    # emulatore minimo: capisce solo le sequenze che emette il Renderer
+    def __init__(self, height, width):
+        self.h = height
+        self.w = width
+        self.cells = [[(" ", "", "")] * width for _ in range(height)]
+        self.y = 0
+        self.x = 0
+        self.fg = ""
+        self.bg = ""
+
+    def feed(self, data):
+        text = bytes(data).decode("utf-8")
+        i = 0
+        n = len(text)
+        while i < n:
+            c = text[i]
+            if c == "\033" and i + 1 < n and text[i + 1] == "[":
+                j = i + 2
+                while not ("@" <= text[j] <= "~"):
+                    j += 1
+                self._csi(text[i + 2:j], text[j])
+                i = j + 1
+                continue
+            width = char_width(c)
+            if width == 0:
+                # segno combinante: si attacca alla cella precedente
+                x = self.x - 1
+                if 0 <= self.y < self.h and 0 <= x < self.w:
+                    row = self.cells[self.y]
+                    if row[x][0] == WIDE_TAIL and x:
+                        x -= 1
+                    row[x] = (row[x][0] + c,) + row[x][1:]
+                i += 1
+                continue
+            if 0 <= self.y < self.h and 0 <= self.x < self.w:
+                self._put(self.x, (c, self.fg, self.bg))
+                if width == 2 and self.x + 1 < self.w:
+                    self._put(self.x + 1, (WIDE_TAIL, self.fg, self.bg))
+            self.x += width
+            i += 1
+
+    def _put(self, x, cell):
+        # come xterm: scrivere su meta' di un carattere largo cancella l'altra meta'
+        row = self.cells[self.y]
+        old = row[x]
+        if old[0] == WIDE_TAIL and x:
+            row[x - 1] = (" ",) + row[x - 1][1:]
+        elif is_wide(old) and x + 1 < self.w:
+            row[x + 1] = (" ",) + row[x + 1][1:]
+        row[x] = cell
+
+    def _csi(self, params, final):
+        if final == "H":
+            row, _, col = params.partition(";")
+            self.y = int(row or 1) - 1
+            self.x = int(col or 1) - 1
+        elif final == "J" and params == "2":
+            self.cells = [[(" ", "", "")] * self.w for _ in range(self.h)]
+        elif final == "m":
+            parts = params.split(";")
+            k = 0
+            while k < len(parts):
+                p = parts[k]
+                if p in ("", "0"):
+                    self.fg = self.bg = ""
+                    k += 1
+                elif p in ("38", "48"):
+                    size = 5 if parts[k + 1] == "2" else 3
+                    value = ";".join(parts[k:k + size])
+                    if p == "38":
+                        self.fg = value
+                    else:
+                        self.bg = value
+                    k += size
+                else:
+                    k += 1
+
+
+class StreamCapture:
+    # listener del renderer: raccoglie lo stream esattamente come lo riceve
+    # il backend, che resta quello vero (backend.write non viene toccato)
+    def __init__(self):
+        self.stream = bytearray()
+
+    def frame_flushed(self, renderer, data):
+        self.stream += data
+
+
+class DiscardWriter:
+    # al posto di FdWriter: i backend che scrivono sul terminale non sporcano stdout
+    blocked_time = 0.0
+
+    def write(self, data):
+        pass
+
+
+def golden_run(config, size, ticks, seed, renderer_cls, backend_name, dt=GOLDEN_DT):
+    random.seed(seed)
+    school_directions.clear()
+    cluster_centers.clear()
+
+    backend = make_backend(backend_name)
+    backend.writer = DiscardWriter()
+
+    config, renderer, compositor, fish_list, bubbles, visible_y, visible_x, world_y, world_x = load_acq(
+        config=config, size=size, backend=backend, interactive=False
+    )
+    renderer = renderer_cls(visible_y, visible_x, backend)
+    capture = StreamCapture()
+    renderer.listeners.append(capture)
+    stream = capture.stream
+
+    flush = renderer.flush
+    flush_time = [0.0]
+    def timed_flush(force=False):
+        t0 = time.perf_counter()
+        flush(force)
+        flush_time[0] += time.perf_counter() - t0
+    renderer.flush = timed_flush
+
+    screen = TerminalScreen(visible_y, visible_x)
+    grids = []
+    screens = []
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        start = len(stream)
+        fish_list = simulate(
+            config, renderer, compositor, fish_list, bubbles,
+            visible_y, world_y, world_x, dt
+        )
+        screen.feed(stream[start:])
+        grids.append([
+            [(ch, sgr_key(fg_code), sgr_key(bg_code or renderer.row_bg[y])) for ch, fg_code, bg_code in row]
+            for y, row in enumerate(renderer.back)
+        ])
+        screens.append([list(row) for row in screen.cells])
+
+    return {
+        "grids": grids,
+        "screens": screens,
+        "bytes": len(stream),
+        "sha256": hashlib.sha256(stream).hexdigest(),
+        # NullBackend conta quello che riceve: deve essere tutto lo stream
+        "backend_bytes": getattr(backend, "bytes_written", len(stream)),
+        "total": time.perf_counter() - t0,
+        "flush": flush_time[0],
+    }
+
+
+def first_divergence(ref_frames, frames, colors=True):
+    for t, (a, b) in enumerate(zip(ref_frames, frames)):
+        for y, (row_a, row_b) in enumerate(zip(a, b)):
+            if row_a == row_b:
+                continue
+            for x, (ca, cb) in enumerate(zip(row_a, row_b)):
+                if (ca != cb) if colors else (ca[0] != cb[0]):
+                    return t + 1, y, x, ca, cb
+    return None
+
+
+def golden_configs(base):
+    gradient = dict(base, background={"gradient": [[0, 40, 80], [0, 10, 30]]})
+    # pesci e scenografia con caratteri larghi e segni combinanti
+    wide = dict(
+        base,
+        species=base["species"] + [
+            dict(base["species"][0], name="emojifish", shape=[[">🐟🐠", " ～〜"]], max_population=6),
+            dict(base["species"][0], name="kanjifish", shape=[["<°)))彡", " e\u0301~"]], max_population=6),
+        ],
+        static_objects=base["static_objects"] + [
+            dict(base["static_objects"][0], name="coral", shape=["🌿 🌿", "┗━━┛"], count=3),
+        ],
+    )
+    return {"config.json": base, "config.json+gradient": gradient, "config.json+wide": wide}
+
+
+def encode_frames(grids):
+    # ogni tick: solo le celle cambiate, [y, x, carattere, id di stile]
+    styles = {}
+    frames = []
+    prev = None
+    for grid in grids:
+        delta = []
+        for y, row in enumerate(grid):
+            if prev is not None and row == prev[y]:
+                continue
+            for x, (ch, fg_key, bg_key) in enumerate(row):
+                if prev is None or prev[y][x] != (ch, fg_key, bg_key):
+                    sid = styles.setdefault((fg_key, bg_key), len(styles))
+                    delta.append([y, x, ch, sid])
+        frames.append(delta)
+        prev = grid
+    return frames, [list(style) for style in styles]
+
+
+def decode_frames(frames, styles, height, width):
+    styles = [tuple(style) for style in styles]
+    grid = [[(" ", "", "")] * width for _ in range(height)]
+    grids = []
+    for delta in frames:
+        grid = [row[:] for row in grid]
+        for y, x, ch, sid in delta:
+            grid[y][x] = (ch,) + styles[sid]
+        grids.append(grid)
+    return grids
+
+
+def golden_record(ticks=120, seed=1234, path=GOLDEN_FILE, out=None):
+    out = out or sys.stdout
+    configs = golden_configs(load_config())
+    corpus = {"seed": seed, "ticks": ticks, "dt": GOLDEN_DT, "configs": configs, "cases": []}
+
+    for config_name, config in configs.items():
+        for size in GOLDEN_SIZES:
+            case = f"{config_name} {size[1]}x{size[0]}"
+            ref = golden_run(config, size, ticks, seed, ReferenceRenderer, "truecolor")
+
+            # il riferimento deve riprodurre esattamente la sua griglia
+            div = first_divergence(ref["grids"], ref["screens"])
+            if div:
+                out.write(f"{case:<32} reference stream/grid DIVERGE tick {div[0]} y={div[1]} x={div[2]}: "
+                          f"{div[3]!r} != {div[4]!r}\n")
+                return False
+
+            frames, styles = encode_frames(ref["grids"])
+            corpus["cases"].append({
+                "name": case,
+                "config": config_name,
+                "size": list(size),
+                "styles": styles,
+                "frames": frames,
+                "stream_bytes": ref["bytes"],
+                "stream_sha256": ref["sha256"],
+            })
+            out.write(f"{case:<32} registrato: {ticks} tick, stream {ref['bytes']} byte\n")
+            out.flush()
+
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(corpus, f, ensure_ascii=False, separators=(",", ":"))
+    out.write(f"corpus salvato: {path}\n")
+    return True
+
+
+def golden_check(ticks=None, path=GOLDEN_FILE, out=None):
+    out = out or sys.stdout
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            corpus = json.load(f)
+    except FileNotFoundError:
+        out.write(f"manca {path}: registralo con python golden.py --record\n")
+        return False
+
+    ticks = min(ticks or corpus["ticks"], corpus["ticks"])
+    # il riferimento di oggi va confrontato col corpus come gli altri: se
+    # diverge e' cambiata la simulazione o il disegno, non il flush
+    candidates = (
+        ("ReferenceRenderer", ReferenceRenderer, "truecolor"),
+        ("Renderer/truecolor", Renderer, "truecolor"),
+        ("Renderer/null", Renderer, "null"),
+        ("Renderer/256", Renderer, "256"),
+        ("Renderer/mono", Renderer, "mono"),
+    )
+
+    failures = 0
+    for case in corpus["cases"]:
+        config = corpus["configs"][case["config"]]
+        size = tuple(case["size"])
+        recorded = decode_frames(case["frames"][:ticks], case["styles"], *size)
+
+        ref = None
+        for label, renderer_cls, backend_name in candidates:
+            got = golden_run(config, size, ticks, corpus["seed"], renderer_cls, backend_name, corpus["dt"])
+            ref = ref or got
+            # con backend diversi i colori cambiano per forza: si confrontano i caratteri
+            colors = backend_name in ("truecolor", "null")
+            div = (
+                first_divergence(recorded, got["grids"], colors)
+                or first_divergence(recorded, got["screens"], colors)
+                or first_divergence(got["grids"], got["screens"])
+            )
+            if div:
+                failures += 1
+                status = f"DIVERGE tick {div[0]} y={div[1]} x={div[2]}: {div[3]!r} != {div[4]!r}"
+            elif got["backend_bytes"] != got["bytes"]:
+                failures += 1
+                status = f"DIVERGE il backend ha ricevuto {got['backend_bytes']} byte su {got['bytes']}"
+            elif (renderer_cls is ReferenceRenderer and ticks == corpus["ticks"]
+                  and got["sha256"] != case["stream_sha256"]):
+                failures += 1
+                status = f"DIVERGE stream del riferimento: {got['bytes']} byte, registrati {case['stream_bytes']}"
+            else:
+                status = "ok"
+            out.write(
+                f"{case['name']:<32} {label:<20} {status:<6} "
+                f"flush {ref['flush'] * 1000:8.1f} -> {got['flush'] * 1000:8.1f} ms  "
+                f"total {ref['total'] * 1000:8.1f} -> {got['total'] * 1000:8.1f} ms  "
+                f"bytes {ref['bytes']} -> {got['bytes']}\n"
+            )
+            out.flush()
+
+    out.write(f"{failures} divergenze\n")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="confronta simulazione, disegno, renderer e backend con i frame registrati")
+    parser.add_argument("--record", action="store_true",
+                        help="registra il corpus con il renderer di riferimento")
+    parser.add_argument("--ticks", type=int, metavar="N",
+                        help="tick da registrare (120) o da confrontare (tutti quelli registrati)")
+    parser.add_argument("--seed", type=int, default=1234, metavar="SEED",
+                        help="seed della registrazione")
+    args = parser.parse_args()
+    if args.record:
+        ok = golden_record(args.ticks or 120, args.seed)
+    else:
+        ok = golden_check(args.ticks)
+    sys.exit(0 if ok else 1)